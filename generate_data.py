@@ -3,10 +3,18 @@
 import os
 import requests
 import json
-import hashlib
+import orjson
+import re
+from hashlib import sha256
 import sys
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 def get_authenticated_session(user, password):
     session = requests.Session()
@@ -14,7 +22,7 @@ def get_authenticated_session(user, password):
     try:
         response = session.post(login_url, data={"email": user, "password": password})
         response.raise_for_status()
-        login_data = response.json()
+        login_data = orjson.loads(response.content)
     except Exception as e:
         print(f"Login failed: {e}")
         sys.exit(1)
@@ -25,40 +33,155 @@ def get_authenticated_session(user, password):
 
     return session
 
-def get_github_team_members(token, org, team_slug):
-    """Fetch all members of a GitHub team."""
-    print(f"Fetching GitHub members for team: {team_slug}")
-    members = set()
-    url = f"https://api.github.com/orgs/{org}/teams/{team_slug}/members"
-    headers = {
+def get_github_session(token):
+    """Create a pooled session for GitHub API calls, reusing one TLS connection."""
+    session = requests.Session()
+    session.headers.update({
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json",
-    }
-    
-    while url:
-        response = requests.get(url, headers=headers)
+    })
+    retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 503, 504],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=20, max_retries=retry))
+    return session
+
+RATE_LIMIT_RETRIES = 3
+
+def rate_limit_wait(response):
+    """Return seconds to wait before retrying a rate-limited response, or None."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    reset = response.headers.get("X-RateLimit-Reset")
+    if response.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+        return max(0, int(reset) - time.time())
+    return None
+
+def github_request(gh_session, method, url, **kwargs):
+    """Send a GitHub API request, sleeping through primary and secondary rate limits.
+
+    The session adapter already retries 429s that carry Retry-After; this
+    covers 403s and any 429 the adapter gives up on, e.g. primary rate-limit
+    exhaustion signalled only by X-RateLimit-Reset.
+    """
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        response = gh_session.request(method, url, **kwargs)
+        if response.status_code not in (403, 429) or attempt == RATE_LIMIT_RETRIES:
+            return response
+        wait = rate_limit_wait(response)
+        if wait is None:
+            return response
+        print(f"  [~] GitHub rate limit hit, waiting {wait:.0f}s before retrying...")
+        time.sleep(wait)
+
+PAGE_WORKERS = 8
+ETAG_CACHE_PATH = ".cache/github_etags.json"
+
+def load_etag_cache(path):
+    """Load the {url: {"etag", "link", "body"}} cache of conditional GET responses."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_etag_cache(path, cache):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(cache, f)
+
+LINK_RE = re.compile(r'<([^>]+)>;\s*rel="([^"]+)"')
+
+def parse_link(link_header):
+    """Parse a Link header into a {rel: url} dict."""
+    return {rel: url for url, rel in LINK_RE.findall(link_header or "")}
+
+def with_page(url, page):
+    """Return url with its page query parameter set to page."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query["page"] = str(page)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def fetch_github_pages(gh_session, url, description, etag_cache, fields):
+    """Fetch every page of a paginated GitHub list endpoint.
+
+    The first page's Link header names the last page, so the remaining pages
+    are requested concurrently. The first page is always fetched
+    unconditionally so its Link header is current; later pages seen before
+    are requested with If-None-Match and served from etag_cache on 304. Only
+    the given fields of each item are kept, so the cache holds no more than
+    the script uses. Pages that fail are reported and skipped.
+    """
+    def fetch_page(page_url, conditional=True):
+        cached = etag_cache.get(page_url) if conditional else None
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = github_request(gh_session, "GET", page_url, headers=headers)
+        link = response.headers.get("Link")
+        if response.status_code == 304 and cached:
+            return cached["body"], link
         if response.status_code != 200:
-            print(f"Failed to fetch GitHub members: {response.status_code} {response.text}")
+            print(f"Failed to fetch {description}: {response.status_code} {response.text}")
+            return None
+        body = [{field: item.get(field) for field in fields} for item in orjson.loads(response.content)]
+        etag = response.headers.get("ETag")
+        if etag:
+            etag_cache[page_url] = {"etag": etag, "body": body}
+        return body, link
+
+    first = fetch_page(url, conditional=False)
+    if first is None:
+        return []
+    items, link = first
+
+    last_url = parse_link(link).get("last")
+    if last_url:
+        last_page = int(dict(parse_qsl(urlsplit(last_url).query)).get("page", 1))
+        page_urls = [with_page(last_url, page) for page in range(2, last_page + 1)]
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+            pages = list(executor.map(fetch_page, page_urls))
+        for page in pages:
+            if page is not None:
+                items.extend(page[0])
+        link = pages[-1][1] if pages and pages[-1] is not None else None
+
+    # The list may have grown while paging; follow any remaining next links
+    next_url = parse_link(link).get("next")
+    while next_url:
+        page = fetch_page(next_url)
+        if page is None:
             break
-        
-        for user in response.json():
-            members.add(user["login"].lower())
-            
-        if "Link" in response.headers:
-            links = response.headers["Link"].split(",")
-            url = None
-            for link in links:
-                if 'rel="next"' in link:
-                    url = link.split(";")[0].strip("<> ")
-                    break
-        else:
-            url = None
-            
+        items.extend(page[0])
+        next_url = parse_link(page[1]).get("next")
+
+    return items
+
+def get_github_team_members(gh_session, org, team_slug, etag_cache):
+    """Fetch all members of a GitHub team."""
+    print(f"Fetching GitHub members for team: {team_slug}")
+    members = set()
+    url = f"https://api.github.com/orgs/{org}/teams/{team_slug}/members?per_page=100"
+
+    for user in fetch_github_pages(gh_session, url, "GitHub members", etag_cache, ("login",)):
+        members.add(sys.intern(user["login"].lower()))
+
     return members
 
 INVITATION_EXPIRY_DAYS = 7
 
-def get_pending_invitations(token, org, team_slug):
+def get_pending_invitations(gh_session, org, team_slug, etag_cache):
     """Fetch all pending invitations for a GitHub team.
 
     Returns a dict mapping lowercase username to invitation metadata:
@@ -67,61 +190,37 @@ def get_pending_invitations(token, org, team_slug):
     """
     print(f"Fetching pending invitations for team: {team_slug}")
     pending = {}
-    url = f"https://api.github.com/orgs/{org}/teams/{team_slug}/invitations"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
+    url = f"https://api.github.com/orgs/{org}/teams/{team_slug}/invitations?per_page=100"
     now = datetime.now(timezone.utc)
 
-    while url:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            print(f"Failed to fetch pending invitations: {response.status_code} {response.text}")
-            break
-
-        for invite in response.json():
-            login = invite.get("login")
-            if not login:
-                continue
-            created_at_str = invite.get("created_at", "")
-            invite_id = invite.get("id")
-            expired = False
-            if created_at_str:
-                try:
-                    created_at = datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
-                    expired = (now - created_at).days >= INVITATION_EXPIRY_DAYS
-                except ValueError:
-                    pass
-            pending[login.lower()] = {
-                "id": invite_id,
-                "created_at": created_at_str,
-                "expired": expired,
-            }
-
-        if "Link" in response.headers:
-            links = response.headers["Link"].split(",")
-            url = None
-            for link in links:
-                if 'rel="next"' in link:
-                    url = link.split(";")[0].strip("<> ")
-                    break
-        else:
-            url = None
+    for invite in fetch_github_pages(gh_session, url, "pending invitations", etag_cache, ("login", "id", "created_at")):
+        login = invite.get("login")
+        if not login:
+            continue
+        created_at_str = invite.get("created_at", "")
+        invite_id = invite.get("id")
+        expired = False
+        if created_at_str:
+            try:
+                created_at = datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
+                expired = (now - created_at).days >= INVITATION_EXPIRY_DAYS
+            except ValueError:
+                pass
+        pending[sys.intern(login.lower())] = {
+            "id": invite_id,
+            "created_at": created_at_str,
+            "expired": expired,
+        }
 
     expired_count = sum(1 for v in pending.values() if v["expired"])
     print(f"Found {len(pending)} pending invitations ({expired_count} expired).")
     return pending
 
-def invite_to_github_team(token, org, team_slug, username):
+def invite_to_github_team(gh_session, org, team_slug, username):
     """Invite or add a user to a GitHub team."""
     url = f"https://api.github.com/orgs/{org}/teams/{team_slug}/memberships/{username}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
     try:
-        response = requests.put(url, headers=headers)
+        response = github_request(gh_session, "PUT", url)
         if response.status_code in [200, 201]:
             print(f"  [+] Invited/Added {username}")
             return True
@@ -132,18 +231,14 @@ def invite_to_github_team(token, org, team_slug, username):
         print(f"  [!] Error inviting {username}: {e}")
         return False
 
-def cancel_github_invitation(token, org, invitation_id, username):
+def cancel_github_invitation(gh_session, org, invitation_id, username):
     """Cancel an expired GitHub org invitation so it can be re-sent."""
     if not invitation_id:
         print(f"  [!] No invitation ID available to cancel for {username}, skipping cancel step.")
         return False
     url = f"https://api.github.com/orgs/{org}/invitations/{invitation_id}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
     try:
-        response = requests.delete(url, headers=headers)
+        response = github_request(gh_session, "DELETE", url)
         if response.status_code == 204:
             print(f"  [~] Cancelled expired invitation for {username}")
             return True
@@ -154,6 +249,40 @@ def cancel_github_invitation(token, org, invitation_id, username):
         print(f"  [!] Error cancelling invitation for {username}: {e}")
         return False
 
+INVITE_WORKERS = 8
+
+def process_invite(gh_session, org, team_slug, gh_id, invite_info):
+    """Invite a user, re-sending expired invitations and skipping live ones.
+
+    Returns "sent", "resent" or "pending", or None if the invite failed.
+    """
+    if invite_info is None:
+        return "sent" if invite_to_github_team(gh_session, org, team_slug, gh_id) else None
+    if not invite_info["expired"]:
+        return "pending"
+    print(f"  [~] Invitation for {gh_id} expired (sent {invite_info['created_at']}), re-sending...")
+    cancel_github_invitation(gh_session, org, invite_info["id"], gh_id)
+    return "resent" if invite_to_github_team(gh_session, org, team_slug, gh_id) else None
+
+
+GROUPSIO_PAGE_DELAY = 0.5
+
+def groupsio_page_delay(response):
+    """Return seconds to pause before the next Groups.io page.
+
+    Uses the X-Rate-Limit-Remaining/Reset headers when present, falling back to
+    GROUPSIO_PAGE_DELAY when they are missing.
+    """
+    try:
+        remaining = int(response.headers["X-Rate-Limit-Remaining"])
+        reset = float(response.headers["X-Rate-Limit-Reset"])
+    except (KeyError, ValueError):
+        return GROUPSIO_PAGE_DELAY
+    if remaining > 10:
+        return 0
+    # Reset may be an epoch timestamp or a number of seconds until reset
+    until_reset = reset - time.time() if reset > 1e9 else reset
+    return max(0, until_reset) / max(remaining, 1)
 
 def fetch_groupsio_data(session, group_name):
     """Fetch all members from Groups.io and extract GitHub IDs."""
@@ -171,7 +300,7 @@ def fetch_groupsio_data(session, group_name):
                 if response.status_code != 200:
                     print(f"\nAPI error {response.status_code}: {response.text}")
                 response.raise_for_status()
-                data = response.json()
+                data = orjson.loads(response.content)
                 break
             except Exception as e:
                 if attempt < 2:
@@ -189,39 +318,42 @@ def fetch_groupsio_data(session, group_name):
         next_page_token = data.get("next_page_token", 0)
         if next_page_token == 0:
             break
-        time.sleep(0.5)
+        time.sleep(groupsio_page_delay(response))
             
     print(f"\nCompleted Groups.io fetch.")
     return members_list
 
-def sync_and_generate_data(members_list, gh_team_members, pending_invitations, gh_token, org, team_slug):
+def sync_and_generate_data(members_list, gh_team_members, pending_invitations, gh_session, org, team_slug):
     """Sync Groups.io data with GitHub team and generate the UI mapping."""
     members_data = {}
     expected_gh_ids = set()
+    gh_lower_to_hashes = defaultdict(list)
 
     # Process Groups.io members
     for member in members_list:
-        email = member.get("email", "").lower().strip()
+        raw_email = member.get("email")
+        if not raw_email:
+            continue
+        email = raw_email.strip().lower()
         if not email:
             continue
 
-        github_id = ""
-        if "extra_member_data" in member:
-            for item in member["extra_member_data"]:
-                if item.get("col_id") == 2:
-                    github_id = item.get("text", "").strip()
-                    break
+        github_id = next(
+            (item.get("text", "").strip() for item in member.get("extra_member_data", ()) if item.get("col_id") == 2),
+            "",
+        )
 
-        if github_id:
-            expected_gh_ids.add(github_id.lower())
+        gh_id_lower = sys.intern(github_id.lower())
 
         # Prepare data for static UI
-        email_hash = hashlib.sha256(email.encode('utf-8')).hexdigest()
-        gh_id_lower = github_id.lower() if github_id else ""
+        email_hash = sha256(email.encode('utf-8')).hexdigest()
+        if gh_id_lower:
+            expected_gh_ids.add(gh_id_lower)
+            gh_lower_to_hashes[gh_id_lower].append(email_hash)
         members_data[email_hash] = {
             "github_id": github_id,
-            "is_in_team": gh_id_lower in gh_team_members if github_id else False,
-            "invitation_sent": gh_id_lower in pending_invitations if github_id else False
+            "is_in_team": gh_id_lower in gh_team_members if gh_id_lower else False,
+            "invitation_sent": gh_id_lower in pending_invitations if gh_id_lower else False
         }
 
     print("\n--- Sync & Audit Report ---")
@@ -231,38 +363,29 @@ def sync_and_generate_data(members_list, gh_team_members, pending_invitations, g
     skipped_pending = 0
     expired_resent = 0
     print("New members to invite:")
-    for gh_id in expected_gh_ids:
-        if gh_id in gh_team_members:
-            continue
-        if gh_id in pending_invitations:
-            invite_info = pending_invitations[gh_id]
-            if invite_info["expired"]:
-                print(f"  [~] Invitation for {gh_id} expired (sent {invite_info['created_at']}), re-sending...")
-                cancel_github_invitation(gh_token, org, invite_info["id"], gh_id)
-                if invite_to_github_team(gh_token, org, team_slug, gh_id):
-                    expired_resent += 1
-                    for h in members_data:
-                        if members_data[h]["github_id"].lower() == gh_id:
-                            members_data[h]["invitation_sent"] = True
-            else:
-                skipped_pending += 1
-            continue
-        if invite_to_github_team(gh_token, org, team_slug, gh_id):
+    to_invite = [(gh_id, pending_invitations.get(gh_id)) for gh_id in expected_gh_ids - gh_team_members]
+    with ThreadPoolExecutor(max_workers=INVITE_WORKERS) as executor:
+        results = list(executor.map(lambda item: process_invite(gh_session, org, team_slug, *item), to_invite))
+
+    for (gh_id, _), result in zip(to_invite, results):
+        if result == "pending":
+            skipped_pending += 1
+        elif result == "resent":
+            expired_resent += 1
+            for h in gh_lower_to_hashes.get(gh_id, ()):
+                members_data[h]["invitation_sent"] = True
+        elif result == "sent":
             invites_sent += 1
-            for h in members_data:
-                if members_data[h]["github_id"].lower() == gh_id:
-                    members_data[h]["is_in_team"] = True
-                    members_data[h]["invitation_sent"] = True
+            for h in gh_lower_to_hashes.get(gh_id, ()):
+                members_data[h]["is_in_team"] = True
+                members_data[h]["invitation_sent"] = True
 
     # 2. LOG UNAUTHORIZED MEMBERS (AUDIT ONLY)
-    unauthorized_members = []
-    for current_gh_id in gh_team_members:
-        if current_gh_id not in expected_gh_ids:
-            unauthorized_members.append(current_gh_id)
+    unauthorized_members = sorted(gh_team_members - expected_gh_ids)
 
     print("\nGitHub IDs in team but not found in Groups.io:")
-    for gh_id in sorted(unauthorized_members):
-        print(f"  - {gh_id}")
+    if unauthorized_members:
+        sys.stdout.write("".join(f"  - {gh_id}\n" for gh_id in unauthorized_members))
 
     print("\nStatistics:")
     print(f"  Total Groups.io Members: {len(members_list)}")
@@ -276,6 +399,13 @@ def sync_and_generate_data(members_list, gh_team_members, pending_invitations, g
 
     return members_data
 
+def write_atomic(path, data):
+    """Write bytes to path via a temp file so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb", buffering=1 << 20) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
 def main():
     user = os.environ.get("GROUPSIO_USER")
     password = os.environ.get("GROUPSIO_PASSWORD")
@@ -288,14 +418,22 @@ def main():
         print("Error: Missing required environment variables (GROUPSIO_USER, GROUPSIO_PASSWORD, GHTOKEN)")
         sys.exit(1)
 
-    gh_team_members = get_github_team_members(gh_token, org, team_slug)
-    pending_invitations = get_pending_invitations(gh_token, org, team_slug)
-    session = get_authenticated_session(user, password)
+    gh_session = get_github_session(gh_token)
+    etag_cache = load_etag_cache(ETAG_CACHE_PATH)
+    # The GitHub fetches and the Groups.io login are independent, so overlap them
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        members_future = executor.submit(get_github_team_members, gh_session, org, team_slug, etag_cache)
+        invitations_future = executor.submit(get_pending_invitations, gh_session, org, team_slug, etag_cache)
+        session_future = executor.submit(get_authenticated_session, user, password)
+        gh_team_members = members_future.result()
+        pending_invitations = invitations_future.result()
+        session = session_future.result()
+    save_etag_cache(ETAG_CACHE_PATH, etag_cache)
     
     group_name = os.environ.get("GROUPSIO_GROUP", "risc-v")
     groupsio_members = fetch_groupsio_data(session, group_name)
 
-    members_data = sync_and_generate_data(groupsio_members, gh_team_members, pending_invitations, gh_token, org, team_slug)
+    members_data = sync_and_generate_data(groupsio_members, gh_team_members, pending_invitations, gh_session, org, team_slug)
     
     output = {
         "last_updated": datetime.now(timezone.utc).isoformat(),
@@ -303,8 +441,7 @@ def main():
     }
 
     os.makedirs("public", exist_ok=True)
-    with open("public/data.json", "w") as f:
-        json.dump(output, f)
+    write_atomic("public/data.json", orjson.dumps(output))
     
     print(f"Successfully generated data.json with {len(members_data)} entries.")
 